@@ -2,7 +2,6 @@ import os
 from flask import Flask, render_template, request, redirect, url_for, flash, session
 from werkzeug.utils import secure_filename
 from CaveAvin import * # Importe la classe Cave_a_vin
-import sqlite3
 
 app = Flask(__name__)
 app.secret_key = "supersecret"
@@ -16,20 +15,39 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# --- Stockage ---
+# CAVE_STOCKAGE=sqlite (défaut), memoire ou postgres (avec CAVE_PG_DSN)
+# CAVE_MODE=shards : un fichier SQLite par utilisateur (CAVE_NB_SHARDS pour regrouper par hash)
+# CAVE_MAX_CONNEXIONS : connexions ouvertes (shards SQLite) ou taille du pool PostgreSQL
+CAVE_STOCKAGE = os.environ.get('CAVE_STOCKAGE', 'sqlite')
+CAVE_PG_DSN = os.environ.get('CAVE_PG_DSN', '')
+CAVE_MODE = os.environ.get('CAVE_MODE', 'unique')
+CAVE_DOSSIER_SHARDS = os.environ.get('CAVE_DOSSIER_SHARDS', 'shards')
+CAVE_NB_SHARDS = int(os.environ['CAVE_NB_SHARDS']) if os.environ.get('CAVE_NB_SHARDS') else None
+CAVE_MAX_CONNEXIONS = int(os.environ.get('CAVE_MAX_CONNEXIONS', 16))
+
+def creer_stockage():
+    if CAVE_STOCKAGE == 'memoire':
+        return StockageMemoire()
+    if CAVE_STOCKAGE == 'postgres':
+        return StockagePostgres(CAVE_PG_DSN, max_connexions=CAVE_MAX_CONNEXIONS)
+    if CAVE_STOCKAGE == 'sqlite':
+        return StockageSQLite(
+            mode=CAVE_MODE,
+            dossier_shards=CAVE_DOSSIER_SHARDS,
+            nb_shards=CAVE_NB_SHARDS,
+            max_connexions=CAVE_MAX_CONNEXIONS
+        )
+    raise ValueError(f"Stockage inconnu: {CAVE_STOCKAGE}")
+
 # --- Instance unique de la classe métier ---
 try:
-    cave = Cave_a_vin()
+    cave = Cave_a_vin(creer_stockage())
     print("Instance Cave_a_vin créée et DB initialisée.")
 except Exception as e:
     print(f"Erreur critique lors de l'instanciation de Cave_a_vin: {e}")
     cave = None
 
-# --- Connexion DB (uniquement pour login/register) ---
-def get_db_connection():
-    conn = sqlite3.connect("cave_a_vin.db")
-    conn.row_factory = sqlite3.Row  # pour accéder aux colonnes par nom
-    return conn
-
 # ------------------- UTILISATEURS -------------------
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -39,17 +57,18 @@ def register():
         email = request.form['email']
         mot_de_passe = request.form['mot_de_passe']
 
-        conn = get_db_connection()
+        if not cave:
+            flash("Erreur critique du système de cave.", "danger")
+            return render_template('register.html')
+
         try:
-            conn.execute("INSERT INTO utilisateurs (nom, email, mot_de_passe) VALUES (?, ?, ?)",
-                         (nom, email, mot_de_passe))
-            conn.commit()
+            cave.creer_utilisateur(nom, email, mot_de_passe)
             flash("Compte créé avec succès !", "success")
             return redirect(url_for('login'))
-        except:
+        except EmailDejaUtilise:
             flash("Erreur : l'email existe déjà.", "danger")
-        finally:
-            conn.close()
+        except Exception as e:
+            flash(f"Erreur lors de la création du compte: {e}", "danger")
 
     return render_template('register.html')
 
@@ -58,10 +77,12 @@ def login():
     if request.method == 'POST':
         email = request.form['email']
         mot_de_passe = request.form['mot_de_passe']
-        conn = get_db_connection()
-        user = conn.execute("SELECT * FROM utilisateurs WHERE email = ? AND mot_de_passe = ?",
-                            (email, mot_de_passe)).fetchone()
-        conn.close()
+
+        if not cave:
+            flash("Erreur critique du système de cave.", "danger")
+            return render_template('login.html')
+
+        user = cave.authentifier(email, mot_de_passe)
         if user:
             session['user_id'] = user['id']
             session['user_nom'] = user['nom']
@@ -198,7 +219,7 @@ def ajouter_bouteille():
                 annee=annee,
                 type_vin=type_vin,
                 domaine=domaine,
-                quantite=int(quantite),
+                quantite=quantite,
                 note=note if note else None,
                 commentaire=commentaire,
                 statut=statut,
@@ -322,7 +343,8 @@ def consommer_bouteille(bouteille_id):
             bouteille_id=bouteille_id,
             quantite_consomme=quantite_consomme,
             note=note,
-            commentaire=commentaire
+            commentaire=commentaire,
+            utilisateur_id=session['user_id']
         )
         
         flash("Bouteille consommée ! Santé !", "success")
@@ -0,0 +1,148 @@
+# comparer_stockages.py
+# Benchmark: joue le même scénario sur chaque backend de stockage et compare les
+# temps d'exécution. La conformité est vérifiée par test_stockages.py (pytest),
+# qui réutilise scenario(); ici les résultats sont seulement comparés à SQLite
+# pour les backends qui numérotent les id globalement.
+#
+#   python comparer_stockages.py [nb_utilisateurs]
+#
+# PostgreSQL est inclus si CAVE_PG_DSN est défini (la base doit être vide),
+# ou si pgserver est installé (serveur jetable).
+import os
+import sys
+import tempfile
+import time
+from CaveAvin import Cave_a_vin, StockageSQLite, StockageMemoire, StockagePostgres
+
+
+def normaliser(valeur):
+    # lignes SQLite/PostgreSQL -> dictionnaires, flottants arrondis
+    if isinstance(valeur, float):
+        return round(valeur, 6)
+    if isinstance(valeur, (list, tuple)):
+        return [normaliser(v) for v in valeur]
+    if hasattr(valeur, 'keys'):
+        return {k: normaliser(valeur[k]) for k in valeur.keys()}
+    return valeur
+
+
+def appeler(resultats, nom, fonction, *args, **kwargs):
+    try:
+        resultats.append((nom, normaliser(fonction(*args, **kwargs))))
+    except Exception as e:
+        resultats.append((nom, f"Erreur: {e}"))
+
+
+def scenario(cave, nb_utilisateurs=3):
+    r = []
+    for i in range(nb_utilisateurs):
+        appeler(r, "creer_utilisateur", cave.creer_utilisateur, f"u{i}", f"u{i}@cave.fr", "secret")
+        uid = cave.authentifier(f"u{i}@cave.fr", "secret")['id']
+        appeler(r, "authentifier", cave.authentifier, f"u{i}@cave.fr", "secret")
+        appeler(r, "authentifier (mauvais mot de passe)", cave.authentifier, f"u{i}@cave.fr", "faux")
+
+        # valeurs reçues des formulaires sous forme de chaînes
+        appeler(r, "ajouter_etagere", cave.ajouter_etagere, "Rouges", "Cave", "10", uid)
+        appeler(r, "ajouter_etagere", cave.ajouter_etagere, "Blancs", "", 4, uid)
+        etageres = cave.lister_etageres(uid)
+        e1, e2 = etageres[0]['id'], etageres[1]['id']
+
+        appeler(r, "ajouter_bouteille", cave.ajouter_bouteille, "Margaux", "2015", "rouge", "Château X", 3,
+                None, "", "en stock", str(e1), uid, None)
+        appeler(r, "ajouter_bouteille", cave.ajouter_bouteille, "Chablis", 2020, "blanc", None, 2,
+                utilisateur_id=uid, etagere_id=e2)
+        appeler(r, "ajouter_bouteille (trop)", cave.ajouter_bouteille, "Sancerre", 2021, "blanc", None, 5,
+                utilisateur_id=uid, etagere_id=e2)
+        appeler(r, "ajouter_bouteille (sans étagère)", cave.ajouter_bouteille, "Cahors", 2018, "rouge",
+                utilisateur_id=uid)
+        appeler(r, "lister_etageres", cave.lister_etageres, uid)
+
+        bouteilles = [b['id'] for e in cave.lister_etageres(uid) for b in e['bouteilles']]
+        b1, b2 = bouteilles[0], bouteilles[1]
+        appeler(r, "consommer_bouteille", cave.consommer_bouteille, b1, 1, 8.5, "Très bon", uid)
+        appeler(r, "consommer_bouteille", cave.consommer_bouteille, b1, 1, 6, "", uid)
+        appeler(r, "consommer_bouteille (tout)", cave.consommer_bouteille, b2, 2, None, "Frais", uid)
+        appeler(r, "consommer_bouteille (inconnue)", cave.consommer_bouteille, 999999, 1, None, None, uid)
+        appeler(r, "ajouter_ou_modifier_note", cave.ajouter_ou_modifier_note, "Margaux", 2015, "rouge",
+                "Château X", uid, 7, "Revu")
+        appeler(r, "ajouter_ou_modifier_note", cave.ajouter_ou_modifier_note, "Margaux", 2015, "rouge",
+                "Château X", uid, 9, "Revu encore")
+
+        appeler(r, "obtenir_bouteille", cave.obtenir_bouteille, b1, uid)
+        appeler(r, "obtenir_bouteille (autre utilisateur)", cave.obtenir_bouteille, b1, uid + 1000)
+        appeler(r, "modifier_bouteille", cave.modifier_bouteille, b1, "Margaux", "2016", "rouge", "Château X",
+                "1", "4.5", "Modifiée", "en stock", e1, uid, "etiquette.png")
+        appeler(r, "obtenir_bouteille", cave.obtenir_bouteille, b1, uid)
+        appeler(r, "modifier_etagere", cave.modifier_etagere, e1, "Rouges bis", "Garage", "12", uid)
+        appeler(r, "obtenir_etagere", cave.obtenir_etagere, e1, uid)
+        appeler(r, "supprimer_etagere (non vide)", cave.supprimer_etagere, e1, uid)
+        appeler(r, "marquer_bouteille_supprimee", cave.marquer_bouteille_supprimee, b1, uid)
+        appeler(r, "supprimer_etagere (non vide)", cave.supprimer_etagere, e2, uid)
+        appeler(r, "ajouter_etagere", cave.ajouter_etagere, "Vide", "", 1, uid)
+        e3 = cave.lister_etageres(uid)[-1]['id']
+        appeler(r, "supprimer_etagere", cave.supprimer_etagere, e3, uid)
+
+        appeler(r, "lister_etageres", cave.lister_etageres, uid)
+        appeler(r, "obtenir_historique_degustation", cave.obtenir_historique_degustation, uid)
+        appeler(r, "obtenir_bouteilles_consommees", cave.obtenir_bouteilles_consommees, uid)
+
+    appeler(r, "creer_utilisateur (email existant)", cave.creer_utilisateur, "x", "u0@cave.fr", "x")
+    return r
+
+
+def dsn_postgres(dossier):
+    if os.environ.get('CAVE_PG_DSN'):
+        return os.environ['CAVE_PG_DSN']
+    try:
+        import pgserver
+    except ImportError:
+        return None
+    return pgserver.get_server(os.path.join(dossier, "postgres"), cleanup_mode="stop").get_uri()
+
+
+def stockages(dossier):
+    # (nom, fabrique, id numérotés globalement)
+    yield "sqlite", lambda: StockageSQLite(db_name=os.path.join(dossier, "unique.db")), True
+    yield "sqlite (mémoire)", lambda: StockageSQLite(db_name=":memory:"), True
+    # avec plusieurs fichiers, les id sont numérotés par fichier
+    yield "shards (utilisateur)", lambda: StockageSQLite(mode="shards", dossier_shards=os.path.join(dossier, "shards_u"),
+                                                         max_connexions=4), False
+    yield "shards (4 groupes)", lambda: StockageSQLite(mode="shards", dossier_shards=os.path.join(dossier, "shards_g"),
+                                                       nb_shards=4, max_connexions=2), False
+    yield "memoire", StockageMemoire, True
+    dsn = dsn_postgres(dossier)
+    if dsn:
+        yield "postgres", lambda: StockagePostgres(dsn), True
+
+
+def comparer(nb_utilisateurs=3):
+    reference = None
+    conforme = True
+    with tempfile.TemporaryDirectory() as dossier:
+        for nom, fabrique, ids_globaux in stockages(dossier):
+            cave = Cave_a_vin(fabrique())
+            debut = time.perf_counter()
+            resultats = scenario(cave, nb_utilisateurs)
+            duree = time.perf_counter() - debut
+            cave.fermer()
+
+            if reference is None:
+                reference = resultats
+                etat = "référence"
+            elif not ids_globaux:
+                etat = "non comparé (id par fichier)"
+            else:
+                differences = [(a, b) for a, b in zip(reference, resultats) if a != b]
+                if len(reference) != len(resultats):
+                    differences.append(("nombre d'appels", len(reference), len(resultats)))
+                etat = "conforme" if not differences else f"{len(differences)} différence(s)"
+                for d in differences[:5]:
+                    print(f"    attendu: {d[0]}\n    obtenu:  {d[1]}")
+                conforme = conforme and not differences
+            print(f"{nom:20} {duree * 1000:10.1f} ms   {etat}")
+    return conforme
+
+
+if __name__ == '__main__':
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    sys.exit(0 if comparer(nb) else 1)
@@ -0,0 +1,72 @@
+# migrer_shards.py
+# Découpe une base cave_a_vin.db existante en un annuaire + un shard par utilisateur.
+#
+#   python migrer_shards.py [source] [dossier] [nb_shards]
+#
+# Les identifiants sont conservés, les sessions et les liens étagère/bouteille restent valides.
+# Outil à lancer une seule fois: le dossier cible doit être vide, il ne fusionne pas
+# avec des shards déjà utilisés par l'application.
+# La répartition choisie (nb_shards) est enregistrée dans l'annuaire: l'application
+# doit ensuite utiliser la même valeur (CAVE_NB_SHARDS), sinon elle refuse de démarrer.
+import os
+import sys
+from CaveAvin import DB, DBShards, DB_NAME
+
+TABLES_PAR_UTILISATEUR = ("etageres", "bouteilles", "notes")
+
+
+def copier_lignes(cursor_src, conn_dest, table, where, params):
+    cursor_src.execute(f"SELECT * FROM {table} WHERE {where}", params)
+    rows = cursor_src.fetchall()
+    if not rows:
+        return 0
+    colonnes = rows[0].keys()
+    conn_dest.executemany(
+        f"INSERT INTO {table} ({', '.join(colonnes)}) VALUES ({', '.join('?' for _ in colonnes)})",
+        [tuple(r) for r in rows]
+    )
+    return len(rows)
+
+
+def migrer_vers_shards(source=DB_NAME, dossier="shards", nb_shards=None):
+    if not os.path.exists(source):
+        raise Exception(f"Base source introuvable: {source}")
+    if os.path.isdir(dossier) and any(f.endswith(".db") for f in os.listdir(dossier)):
+        raise Exception(f"Le dossier {dossier} contient déjà des bases: la migration ne se fait que vers un dossier vide.")
+
+    src = DB(source)
+    shards = DBShards(dossier, nb_shards)
+    cursor = src.conn.cursor()
+
+    try:
+        nb = copier_lignes(cursor, shards.annuaire.conn, "utilisateurs", "1=1", ())
+        shards.annuaire.conn.commit()
+        print(f"{nb} utilisateur(s) copiés dans l'annuaire.")
+
+        cursor.execute("SELECT id FROM utilisateurs ORDER BY id")
+        for u in cursor.fetchall():
+            with shards.connexion(u['id']) as conn:
+                for table in TABLES_PAR_UTILISATEUR:
+                    nb = copier_lignes(cursor, conn, table, "utilisateur_id=?", (u['id'],))
+                    print(f"  utilisateur {u['id']}: {nb} ligne(s) {table} -> {shards.nom_shard(u['id'])}")
+                conn.commit()
+
+        # lignes sans propriétaire connu: signalées mais pas migrées
+        for table in TABLES_PAR_UTILISATEUR:
+            cursor.execute(f"""SELECT COUNT(*) FROM {table}
+                               WHERE utilisateur_id IS NULL
+                                  OR utilisateur_id NOT IN (SELECT id FROM utilisateurs)""")
+            orphelines = cursor.fetchone()[0]
+            if orphelines:
+                print(f"Attention: {orphelines} ligne(s) de {table} sans utilisateur, non migrées.")
+    finally:
+        shards.fermer()
+        src.fermer()
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else DB_NAME
+    dossier = sys.argv[2] if len(sys.argv) > 2 else "shards"
+    nb_shards = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    migrer_vers_shards(source, dossier, nb_shards)
+    print("Migration terminée.")
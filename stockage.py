@@ -0,0 +1,1047 @@
+# stockage.py
+# Backends de stockage de Cave_a_vin: SQLite (base unique ou shards), mémoire, PostgreSQL.
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+DB_NAME = "cave_a_vin.db"
+
+
+class EmailDejaUtilise(Exception):
+    pass
+
+
+# Tables de l'annuaire (partagé entre tous les utilisateurs)
+SCHEMA_ANNUAIRE = [
+    """
+    CREATE TABLE IF NOT EXISTS utilisateurs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        mot_de_passe TEXT NOT NULL
+    )""",
+]
+
+# Tables des données d'un utilisateur (dans un shard, utilisateurs(id) est dans l'annuaire)
+SCHEMA_UTILISATEUR = [
+    """
+    CREATE TABLE IF NOT EXISTS etageres (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom TEXT NOT NULL,
+        emplacement TEXT,
+        places_totales INTEGER NOT NULL,
+        places_disponibles INTEGER NOT NULL,
+        utilisateur_id INTEGER NOT NULL,
+        FOREIGN KEY (utilisateur_id) REFERENCES utilisateurs(id)
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS bouteilles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom TEXT NOT NULL,
+        annee INTEGER,
+        type TEXT,
+        domaine TEXT,
+        quantite INTEGER DEFAULT 1,
+        note REAL,
+        commentaire TEXT,
+        statut TEXT CHECK(statut IN ('en stock','archivé')) DEFAULT 'en stock',
+        etiquette TEXT,
+        supprime INTEGER DEFAULT 0,
+        etagere_id INTEGER,
+        utilisateur_id INTEGER,
+        FOREIGN KEY (etagere_id) REFERENCES etageres(id),
+        FOREIGN KEY (utilisateur_id) REFERENCES utilisateurs(id)
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bouteille_nom TEXT NOT NULL,
+        bouteille_type TEXT NOT NULL,
+        bouteille_annee INTEGER NOT NULL,
+        bouteille_domaine TEXT,
+        utilisateur_id INTEGER NOT NULL,
+        note REAL,
+        commentaire TEXT,
+        FOREIGN KEY (utilisateur_id) REFERENCES utilisateurs(id)
+    )""",
+]
+
+# Répartition des shards, enregistrée dans l'annuaire à la création du dossier
+# (nb_shards NULL: un fichier par utilisateur)
+SCHEMA_PARAMETRES = [
+    """
+    CREATE TABLE IF NOT EXISTS parametres (
+        id INTEGER PRIMARY KEY CHECK(id = 1),
+        nb_shards INTEGER
+    )""",
+]
+
+class DB:
+    def __init__(self, db_name=DB_NAME, schema=None, verbeux=True):
+        # verbeux=False: les shards sont ouverts à la demande, sans messages
+        if verbeux:
+            print(f"Connexion à la base de données {db_name}...")
+        # une seule transaction à la fois sur la connexion partagée entre threads
+        self.verrou = threading.RLock()
+        # base unique par défaut: toutes les tables
+        self.schema = SCHEMA_ANNUAIRE + SCHEMA_UTILISATEUR if schema is None else schema
+        try:
+            self.conn = sqlite3.connect(db_name, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.init_db()
+            if verbeux:
+                print("Connexion réussie !")
+        except sqlite3.Error as e:
+            print(f"Erreur de connexion à la base de données: {e}")
+            self.conn = None
+
+    def init_db(self):
+        cursor = self.conn.cursor()
+        for requete in self.schema:
+            cursor.execute(requete)
+        self.conn.commit()
+
+    def fermer(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+
+class DBShards:
+    """
+    Stockage réparti: un annuaire partagé (table utilisateurs seulement) et un
+    fichier SQLite par utilisateur, ou par groupe d'utilisateurs si nb_shards est
+    fourni, qui contient les étagères, bouteilles et notes.
+    Les connexions aux shards sont ouvertes à la demande et les moins récemment
+    utilisées sont fermées au-delà de max_connexions, sauf celles en cours
+    d'utilisation (voir connexion()).
+    La répartition (nb_shards) est enregistrée dans l'annuaire: rouvrir le
+    dossier avec une autre répartition est refusé, les données ne seraient plus
+    trouvées dans les bons fichiers.
+    """
+    ANNUAIRE = "annuaire.db"
+
+    def __init__(self, dossier="shards", nb_shards=None, max_connexions=16):
+        self.dossier = dossier
+        self.nb_shards = nb_shards or None
+        self.max_connexions = max_connexions
+        os.makedirs(dossier, exist_ok=True)
+        self.chemin_annuaire = os.path.join(dossier, self.ANNUAIRE)
+        self.annuaire = DB(self.chemin_annuaire, SCHEMA_ANNUAIRE + SCHEMA_PARAMETRES)
+        if self.annuaire.conn is None:
+            raise Exception(f"Impossible d'ouvrir l'annuaire {self.chemin_annuaire}")
+        self.verifier_repartition()
+        self.connexions = OrderedDict()
+        self.utilisations = {}
+        self.verrou = threading.Lock()
+
+    @staticmethod
+    def decrire(nb_shards):
+        return f"{nb_shards} shards" if nb_shards else "un fichier par utilisateur"
+
+    def verifier_repartition(self):
+        conn = self.annuaire.conn
+        # la première ouverture du dossier enregistre la répartition demandée
+        conn.execute("INSERT OR IGNORE INTO parametres (id, nb_shards) VALUES (1, ?)", (self.nb_shards,))
+        conn.commit()
+        enregistre = conn.execute("SELECT nb_shards FROM parametres WHERE id = 1").fetchone()['nb_shards']
+        if enregistre != self.nb_shards:
+            self.annuaire.fermer()
+            raise Exception(f"Le dossier {self.dossier} est réparti en {self.decrire(enregistre)}, "
+                            f"pas en {self.decrire(self.nb_shards)}: relancer avec nb_shards={enregistre}.")
+
+    def nom_shard(self, utilisateur_id):
+        if utilisateur_id is None:
+            raise ValueError("utilisateur_id requis pour choisir le shard.")
+        if self.nb_shards:
+            return f"shard_{int(utilisateur_id) % self.nb_shards}.db"
+        return f"utilisateur_{int(utilisateur_id)}.db"
+
+    def chemin_shard(self, utilisateur_id):
+        return os.path.join(self.dossier, self.nom_shard(utilisateur_id))
+
+    @contextmanager
+    def connexion(self, utilisateur_id):
+        """
+        Réserve la connexion du shard pour la durée du bloc with: elle ne peut
+        pas être fermée par l'éviction tant qu'elle est utilisée.
+        """
+        chemin = self.chemin_shard(utilisateur_id)
+        with self.verrou:
+            db = self.connexions.get(chemin)
+            if db is None:
+                db = DB(chemin, SCHEMA_UTILISATEUR, verbeux=False)
+                if db.conn is None:
+                    raise Exception(f"Impossible d'ouvrir le shard {chemin}")
+                self.connexions[chemin] = db
+            self.connexions.move_to_end(chemin)
+            self.utilisations[chemin] = self.utilisations.get(chemin, 0) + 1
+            self._evincer()
+
+        try:
+            with db.verrou:
+                yield db.conn
+        finally:
+            with self.verrou:
+                self.utilisations[chemin] -= 1
+                if not self.utilisations[chemin]:
+                    del self.utilisations[chemin]
+                self._evincer()
+
+    def _evincer(self):
+        # fermer les shards les moins récemment utilisés, sauf ceux réservés
+        # (appelé avec self.verrou)
+        for chemin in list(self.connexions):
+            if len(self.connexions) <= self.max_connexions:
+                break
+            if chemin not in self.utilisations:
+                self.connexions.pop(chemin).fermer()
+
+    def fermer(self):
+        with self.verrou:
+            while self.connexions:
+                _, db = self.connexions.popitem(last=False)
+                db.fermer()
+        self.annuaire.fermer()
+
+
+class Stockage(ABC):
+    """
+    Interface commune des backends utilisés par Cave_a_vin.
+    Les lignes renvoyées s'utilisent comme des dictionnaires (ligne['nom']).
+    Un backend incomplet ne peut pas être instancié.
+    """
+
+    # Utilisateurs
+    @abstractmethod
+    def creer_utilisateur(self, nom, email, mot_de_passe):
+        raise NotImplementedError
+
+    @abstractmethod
+    def authentifier(self, email, mot_de_passe):
+        raise NotImplementedError
+
+    # Étagères
+    @abstractmethod
+    def lister_etageres(self, utilisateur_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def ajouter_etagere(self, nom, emplacement, places_totales, utilisateur_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def obtenir_etagere(self, etagere_id, utilisateur_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def modifier_etagere(self, etagere_id, nom, emplacement, places_totales, utilisateur_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def supprimer_etagere(self, etagere_id, utilisateur_id):
+        raise NotImplementedError
+
+    # Bouteilles
+    @abstractmethod
+    def ajouter_bouteille(self, nom, annee, type_vin, domaine=None, quantite=1, note=None,
+                          commentaire=None, statut='en stock', etagere_id=None, utilisateur_id=None, etiquette=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def obtenir_bouteille(self, bouteille_id, utilisateur_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def modifier_bouteille(self, bouteille_id, nom, annee, type_vin, domaine, quantite, note, commentaire, statut, etagere_id, utilisateur_id, etiquette=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def marquer_bouteille_supprimee(self, bouteille_id, utilisateur_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def consommer_bouteille(self, bouteille_id, quantite_consomme, note=None, commentaire=None, utilisateur_id=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def obtenir_historique_degustation(self, utilisateur_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def obtenir_bouteilles_consommees(self, utilisateur_id):
+        raise NotImplementedError
+
+    # Notes
+    @abstractmethod
+    def ajouter_ou_modifier_note(self, bouteille_nom, bouteille_annee, bouteille_type, bouteille_domaine,
+                                 utilisateur_id, note, commentaire=None):
+        raise NotImplementedError
+
+    def fermer(self):
+        pass
+
+
+class StockageSQL(Stockage):
+    """
+    Requêtes SQL partagées par SQLite et PostgreSQL. Les requêtes sont écrites
+    avec des '?' et converties vers le style de paramètres du backend.
+    """
+    PARAM = "?"
+    ERREUR_INTEGRITE = sqlite3.IntegrityError
+
+    @abstractmethod
+    def _connexion(self, utilisateur_id):
+        # context manager: connexion réservée pour la durée d'une transaction
+        raise NotImplementedError
+
+    @abstractmethod
+    def _connexion_annuaire(self):
+        raise NotImplementedError
+
+    @contextmanager
+    def _transaction(self, utilisateur_id=None, annuaire=False):
+        # valide si tout s'est bien passé, annule sinon
+        connexion = self._connexion_annuaire() if annuaire else self._connexion(utilisateur_id)
+        with connexion as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _executer(self, cursor, requete, params=()):
+        if self.PARAM != "?":
+            requete = requete.replace("?", self.PARAM)
+        cursor.execute(requete, params)
+        return cursor
+
+    def _inserer(self, cursor, requete, params):
+        return self._executer(cursor, requete, params).lastrowid
+
+    # Utilisateurs
+    def creer_utilisateur(self, nom, email, mot_de_passe):
+        with self._transaction(annuaire=True) as cursor:
+            if self._executer(cursor, "SELECT id FROM utilisateurs WHERE email=?", (email,)).fetchone():
+                raise EmailDejaUtilise("Cet email est déjà utilisé.")
+            try:
+                return self._inserer(cursor, "INSERT INTO utilisateurs (nom, email, mot_de_passe) VALUES (?,?,?)",
+                                     (nom, email, mot_de_passe))
+            except self.ERREUR_INTEGRITE as e:
+                # inscription simultanée avec le même email
+                if "unique" not in str(e).lower() or "email" not in str(e):
+                    raise
+                raise EmailDejaUtilise("Cet email est déjà utilisé.")
+
+    def authentifier(self, email, mot_de_passe):
+        with self._transaction(annuaire=True) as cursor:
+            return self._executer(cursor, "SELECT * FROM utilisateurs WHERE email = ? AND mot_de_passe = ?",
+                                  (email, mot_de_passe)).fetchone()
+
+    # Étagères
+    def lister_etageres(self, utilisateur_id):
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, "SELECT * FROM etageres WHERE utilisateur_id=? ORDER BY id", (utilisateur_id,))
+            rows = cursor.fetchall()
+            etageres = []
+            for row in rows:
+                if row['nom'] == 'Consommées':
+                    continue
+
+                etag = dict(row)
+
+                self._executer(cursor, "SELECT * FROM bouteilles WHERE etagere_id=? AND utilisateur_id=? AND supprime=0 ORDER BY id", (etag['id'], utilisateur_id))
+                br = cursor.fetchall()
+
+                etag['bouteilles'] = [dict(b) for b in br if b['statut'] == 'en stock']
+                etag['nb_bouteilles'] = len(etag['bouteilles'])
+                etageres.append(etag)
+
+            return etageres
+
+    def ajouter_etagere(self, nom, emplacement, places_totales, utilisateur_id):
+        with self._transaction(utilisateur_id) as cursor:
+            return self._inserer(cursor, """
+                INSERT INTO etageres (nom, emplacement, places_totales, places_disponibles, utilisateur_id)
+                VALUES (?,?,?,?,?)
+            """, (nom, emplacement, places_totales, places_totales, utilisateur_id))
+
+    def obtenir_etagere(self, etagere_id, utilisateur_id):
+        with self._transaction(utilisateur_id) as cursor:
+            return self._executer(cursor, "SELECT * FROM etageres WHERE id=? AND utilisateur_id=?", (etagere_id, utilisateur_id)).fetchone()
+
+    def modifier_etagere(self, etagere_id, nom, emplacement, places_totales, utilisateur_id):
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, """
+                UPDATE etageres SET nom=?, emplacement=?, places_totales=?
+                WHERE id=? AND utilisateur_id=?
+            """, (nom, emplacement, places_totales, etagere_id, utilisateur_id))
+
+    def supprimer_etagere(self, etagere_id, utilisateur_id):
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, "SELECT COUNT(*) AS nb FROM bouteilles WHERE etagere_id=? AND utilisateur_id=?", (etagere_id, utilisateur_id))
+            count = cursor.fetchone()['nb']
+            if count > 0:
+                raise Exception("Impossible de supprimer une étagère contenant des bouteilles.")
+
+            self._executer(cursor, "DELETE FROM etageres WHERE id=? AND utilisateur_id=?", (etagere_id, utilisateur_id))
+
+    # Bouteilles
+    def ajouter_bouteille(self, nom, annee, type_vin, domaine=None, quantite=1, note=None,
+                          commentaire=None, statut='en stock', etagere_id=None, utilisateur_id=None, etiquette=None):
+        with self._transaction(utilisateur_id) as cursor:
+            if etagere_id:
+                self._executer(cursor, "SELECT places_disponibles FROM etageres WHERE id=? AND utilisateur_id=?", (etagere_id, utilisateur_id))
+                places = cursor.fetchone()
+                if places is None or places['places_disponibles'] < quantite:
+                    raise Exception("Pas assez de place sur l'étagère ou étagère invalide.")
+                self._executer(cursor, "UPDATE etageres SET places_disponibles = places_disponibles - ? WHERE id=?", (quantite, etagere_id))
+
+            return self._inserer(cursor, """
+                INSERT INTO bouteilles (nom, annee, type, domaine, quantite, note, commentaire, statut, etagere_id, utilisateur_id, etiquette)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?)
+            """, (nom, annee, type_vin, domaine, quantite, note, commentaire, statut, etagere_id, utilisateur_id, etiquette))
+
+    def obtenir_bouteille(self, bouteille_id, utilisateur_id):
+        with self._transaction(utilisateur_id) as cursor:
+            return self._executer(cursor, "SELECT * FROM bouteilles WHERE id=? AND utilisateur_id=?", (bouteille_id, utilisateur_id)).fetchone()
+
+    def modifier_bouteille(self, bouteille_id, nom, annee, type_vin, domaine, quantite, note, commentaire, statut, etagere_id, utilisateur_id, etiquette=None):
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, """
+                UPDATE bouteilles SET nom=?, annee=?, type=?, domaine=?, quantite=?, note=?, commentaire=?, statut=?, etagere_id=?, etiquette=?
+                WHERE id=? AND utilisateur_id=?
+            """, (nom, annee, type_vin, domaine, quantite, note, commentaire, statut, etagere_id, etiquette, bouteille_id, utilisateur_id))
+
+    def marquer_bouteille_supprimee(self, bouteille_id, utilisateur_id):
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, "UPDATE bouteilles SET supprime=1 WHERE id=? AND utilisateur_id=?", (bouteille_id, utilisateur_id))
+
+    def consommer_bouteille(self, bouteille_id, quantite_consomme, note=None, commentaire=None, utilisateur_id=None):
+        # utilisateur_id est obligatoire en mode shards pour trouver le bon fichier
+        with self._transaction(utilisateur_id) as cursor:
+            if utilisateur_id is None:
+                self._executer(cursor, "SELECT * FROM bouteilles WHERE id=?", (bouteille_id,))
+            else:
+                self._executer(cursor, "SELECT * FROM bouteilles WHERE id=? AND utilisateur_id=?", (bouteille_id, utilisateur_id))
+            b = cursor.fetchone()
+            if not b:
+                raise Exception("Bouteille introuvable")
+
+            # trouver ou créer étagère "Consommées"
+            self._executer(cursor, "SELECT id FROM etageres WHERE nom='Consommées' AND utilisateur_id=? ORDER BY id", (b['utilisateur_id'],))
+            consommee = cursor.fetchone()
+            if not consommee:
+                etagere_id_cons = self._inserer(cursor, "INSERT INTO etageres (nom, emplacement, places_totales, places_disponibles, utilisateur_id) VALUES (?,?,?,?,?)",
+                                                ('Consommées', '', 1000, 1000, b['utilisateur_id']))
+            else:
+                etagere_id_cons = consommee['id']
+
+            nouvelle_quantite = b['quantite'] - quantite_consomme
+            if nouvelle_quantite <= 0:
+                self._executer(cursor, "UPDATE bouteilles SET statut='archivé', etagere_id=? WHERE id=?", (etagere_id_cons, b['id']))
+            else:
+                self._executer(cursor, "UPDATE bouteilles SET quantite=? WHERE id=?", (nouvelle_quantite, b['id']))
+                self._inserer(cursor, """
+                    INSERT INTO bouteilles (nom, annee, type, domaine, quantite, statut, etagere_id, utilisateur_id, etiquette)
+                    VALUES (?,?,?,?,?,?,?,?,?)
+                """, (b['nom'], b['annee'], b['type'], b['domaine'], quantite_consomme, 'archivé', etagere_id_cons, b['utilisateur_id'], b['etiquette']))
+
+            # libérer la place
+            if b['etagere_id']:
+                self._executer(cursor, "UPDATE etageres SET places_disponibles = places_disponibles + ? WHERE id=?", (quantite_consomme, b['etagere_id']))
+
+            # enregistrer note ou commentaire si fourni
+            if note is not None or (commentaire and commentaire.strip()):
+                self._inserer(cursor, """
+                    INSERT INTO notes (bouteille_nom, bouteille_type, bouteille_annee, bouteille_domaine, utilisateur_id, note, commentaire)
+                    VALUES (?,?,?,?,?,?,?)
+                """, (b['nom'], b['type'], b['annee'], b['domaine'], b['utilisateur_id'], note, commentaire))
+
+    def obtenir_historique_degustation(self, utilisateur_id):
+        """
+        Version finale: Récupère TOUTES les bouteilles consommées
+        et y joint les notes/moyennes si elles existent,
+        en gérant correctement les domaines NULL.
+        """
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, """
+                SELECT
+                    b.id, b.nom, b.annee, b.domaine, b.type, b.quantite,
+                    n.note as note_degustation,
+                    n.commentaire as commentaire_degustation,
+
+                    (SELECT AVG(note) FROM notes n_avg
+                     WHERE n_avg.bouteille_nom = b.nom
+                       AND n_avg.bouteille_annee = b.annee
+                       AND (n_avg.bouteille_domaine = b.domaine OR (n_avg.bouteille_domaine IS NULL AND b.domaine IS NULL))
+                       AND n_avg.utilisateur_id = b.utilisateur_id) as moyenne_notes
+
+                FROM bouteilles b
+
+                LEFT JOIN notes n ON b.nom = n.bouteille_nom
+                                 AND b.annee = n.bouteille_annee
+                                 AND b.utilisateur_id = n.utilisateur_id
+                                 AND (b.domaine = n.bouteille_domaine OR (b.domaine IS NULL AND n.bouteille_domaine IS NULL))
+
+                WHERE b.utilisateur_id = ? AND b.statut = 'archivé'
+                GROUP BY b.id
+                ORDER BY b.id DESC
+            """, (utilisateur_id,))
+
+            return cursor.fetchall()
+
+    # Ancienne fonction (non utilisée par la route /historique)
+    def obtenir_bouteilles_consommees(self, utilisateur_id):
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, "SELECT * FROM bouteilles WHERE utilisateur_id=? AND statut='archivé' ORDER BY id DESC", (utilisateur_id,))
+            rows = cursor.fetchall()
+        consomm = []
+        for r in rows:
+            consomm.append({
+                'bouteille_nom': r['nom'],
+                'bouteille_type': r['type'],
+                'bouteille_annee': r['annee'],
+                'bouteille_domaine': r['domaine'],
+                'quantite': r['quantite'],
+                'etiquette': r['etiquette'],
+                'commentaire': r['commentaire'],
+                'note': r['note']
+            })
+        return consomm
+
+    # Notes
+    def ajouter_ou_modifier_note(self, bouteille_nom, bouteille_annee, bouteille_type, bouteille_domaine,
+                                 utilisateur_id, note, commentaire=None):
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, """
+                SELECT id FROM notes
+                WHERE bouteille_nom=? AND bouteille_annee=? AND bouteille_type=? AND bouteille_domaine=? AND utilisateur_id=?
+                ORDER BY id
+            """, (bouteille_nom, bouteille_annee, bouteille_type, bouteille_domaine, utilisateur_id))
+            row = cursor.fetchone()
+            if row:
+                self._executer(cursor, "UPDATE notes SET note=?, commentaire=? WHERE id=?", (note, commentaire, row['id']))
+            else:
+                self._inserer(cursor, """
+                    INSERT INTO notes (bouteille_nom, bouteille_annee, bouteille_type, bouteille_domaine,
+                                      utilisateur_id, note, commentaire)
+                    VALUES (?,?,?,?,?,?,?)
+                """, (bouteille_nom, bouteille_annee, bouteille_type, bouteille_domaine,
+                      utilisateur_id, note, commentaire))
+
+
+class StockageSQLite(StockageSQL):
+    """
+    mode="unique": toutes les données dans une seule base (cave_a_vin.db par défaut).
+    mode="shards": un fichier SQLite par utilisateur (ou par groupe si nb_shards),
+    avec un annuaire partagé pour la table utilisateurs.
+    """
+
+    def __init__(self, mode="unique", db_name=DB_NAME, dossier_shards="shards", nb_shards=None, max_connexions=16):
+        self.mode = mode
+        if mode == "shards":
+            self.shards = DBShards(dossier_shards, nb_shards, max_connexions)
+            self.db = self.shards.annuaire
+        elif mode == "unique":
+            self.shards = None
+            self.db = DB(db_name)
+        else:
+            raise ValueError(f"Mode de stockage inconnu: {mode}")
+        if self.db.conn is None:
+            raise Exception("Impossible d'ouvrir la base de données.")
+        self.conn = self.db.conn
+
+    @contextmanager
+    def _connexion(self, utilisateur_id):
+        # route vers le shard de l'utilisateur, ou la base unique
+        if self.shards:
+            with self.shards.connexion(utilisateur_id) as conn:
+                yield conn
+        else:
+            with self.db.verrou:
+                yield self.conn
+
+    @contextmanager
+    def _connexion_annuaire(self):
+        with self.db.verrou:
+            yield self.conn
+
+    def fermer(self):
+        if self.shards:
+            self.shards.fermer()
+        else:
+            self.db.fermer()
+
+
+class StockagePostgres(StockageSQL):
+    """
+    Backend PostgreSQL (psycopg2). Chaque transaction prend sa propre connexion
+    dans un pool de max_connexions connexions.
+    `connecter` permet de fournir une autre fabrique de connexions DB-API
+    compatible (paramètres %s, lignes en dictionnaires): une seule connexion
+    est alors ouverte et les transactions passent l'une après l'autre.
+    """
+    PARAM = "%s"
+    ERREUR_INTEGRITE = psycopg2.IntegrityError if psycopg2 else Exception
+
+    def __init__(self, dsn=None, connecter=None, max_connexions=10):
+        self.pool = None
+        self.conn = None
+        self.verrou = threading.RLock()
+        if connecter is None:
+            if psycopg2 is None:
+                raise Exception("psycopg2 est requis pour le stockage PostgreSQL.")
+            self.pool = psycopg2.pool.ThreadedConnectionPool(1, max_connexions, dsn,
+                                                             cursor_factory=psycopg2.extras.RealDictCursor)
+            # getconn() échoue au lieu d'attendre quand le pool est vide
+            self.places = threading.BoundedSemaphore(max_connexions)
+        else:
+            self.conn = connecter()
+        self.init_db()
+
+    def init_db(self):
+        # pas de REFERENCES: SQLite ne vérifie pas les clés étrangères (et ne le
+        # peut pas entre annuaire et shards), PostgreSQL doit se comporter pareil
+        with self._transaction(annuaire=True) as cursor:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS utilisateurs (
+                id SERIAL PRIMARY KEY,
+                nom TEXT NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                mot_de_passe TEXT NOT NULL
+            )""")
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS etageres (
+                id SERIAL PRIMARY KEY,
+                nom TEXT NOT NULL,
+                emplacement TEXT,
+                places_totales INTEGER NOT NULL,
+                places_disponibles INTEGER NOT NULL,
+                utilisateur_id INTEGER NOT NULL
+            )""")
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bouteilles (
+                id SERIAL PRIMARY KEY,
+                nom TEXT NOT NULL,
+                annee INTEGER,
+                type TEXT,
+                domaine TEXT,
+                quantite INTEGER DEFAULT 1,
+                note DOUBLE PRECISION,
+                commentaire TEXT,
+                statut TEXT CHECK(statut IN ('en stock','archivé')) DEFAULT 'en stock',
+                etiquette TEXT,
+                supprime INTEGER DEFAULT 0,
+                etagere_id INTEGER,
+                utilisateur_id INTEGER
+            )""")
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS notes (
+                id SERIAL PRIMARY KEY,
+                bouteille_nom TEXT NOT NULL,
+                bouteille_type TEXT NOT NULL,
+                bouteille_annee INTEGER NOT NULL,
+                bouteille_domaine TEXT,
+                utilisateur_id INTEGER NOT NULL,
+                note DOUBLE PRECISION,
+                commentaire TEXT
+            )""")
+
+    @contextmanager
+    def _connexion(self, utilisateur_id):
+        with self._connexion_annuaire() as conn:
+            yield conn
+
+    @contextmanager
+    def _connexion_annuaire(self):
+        if self.pool is None:
+            with self.verrou:
+                yield self.conn
+            return
+
+        with self.places:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+            finally:
+                # une connexion cassée n'est pas remise dans le pool
+                self.pool.putconn(conn, close=bool(conn.closed))
+
+    def _inserer(self, cursor, requete, params):
+        # pas de lastrowid fiable avec PostgreSQL
+        return self._executer(cursor, requete.rstrip() + " RETURNING id", params).fetchone()['id']
+
+    def obtenir_historique_degustation(self, utilisateur_id):
+        # PostgreSQL refuse les colonnes non agrégées du GROUP BY SQLite:
+        # on prend explicitement la dernière note, comme SQLite le fait
+        with self._transaction(utilisateur_id) as cursor:
+            self._executer(cursor, """
+                SELECT
+                    b.id, b.nom, b.annee, b.domaine, b.type, b.quantite,
+                    n.note as note_degustation,
+                    n.commentaire as commentaire_degustation,
+
+                    (SELECT AVG(note) FROM notes n_avg
+                     WHERE n_avg.bouteille_nom = b.nom
+                       AND n_avg.bouteille_annee = b.annee
+                       AND n_avg.bouteille_domaine IS NOT DISTINCT FROM b.domaine
+                       AND n_avg.utilisateur_id = b.utilisateur_id) as moyenne_notes
+
+                FROM bouteilles b
+
+                LEFT JOIN LATERAL (
+                    SELECT note, commentaire FROM notes
+                    WHERE notes.bouteille_nom = b.nom
+                      AND notes.bouteille_annee = b.annee
+                      AND notes.utilisateur_id = b.utilisateur_id
+                      AND notes.bouteille_domaine IS NOT DISTINCT FROM b.domaine
+                    ORDER BY notes.id DESC
+                    LIMIT 1
+                ) n ON TRUE
+
+                WHERE b.utilisateur_id = ? AND b.statut = 'archivé'
+                ORDER BY b.id DESC
+            """, (utilisateur_id,))
+
+            return cursor.fetchall()
+
+    def fermer(self):
+        if self.pool is not None:
+            self.pool.closeall()
+        else:
+            self.conn.close()
+
+
+class StockageMemoire(Stockage):
+    """
+    Backend entièrement en mémoire (tests, benchmarks). Reproduit le
+    comportement de SQLite, y compris la conversion des types par colonne,
+    les comparaisons avec NULL, les contraintes NOT NULL/CHECK et l'annulation
+    d'une opération qui échoue en cours de route.
+    """
+    SCHEMA = {
+        "utilisateurs": {"id": "INTEGER", "nom": "TEXT", "email": "TEXT", "mot_de_passe": "TEXT"},
+        "etageres": {"id": "INTEGER", "nom": "TEXT", "emplacement": "TEXT", "places_totales": "INTEGER",
+                     "places_disponibles": "INTEGER", "utilisateur_id": "INTEGER"},
+        "bouteilles": {"id": "INTEGER", "nom": "TEXT", "annee": "INTEGER", "type": "TEXT", "domaine": "TEXT",
+                       "quantite": "INTEGER", "note": "REAL", "commentaire": "TEXT", "statut": "TEXT",
+                       "etiquette": "TEXT", "supprime": "INTEGER", "etagere_id": "INTEGER", "utilisateur_id": "INTEGER"},
+        "notes": {"id": "INTEGER", "bouteille_nom": "TEXT", "bouteille_type": "TEXT", "bouteille_annee": "INTEGER",
+                  "bouteille_domaine": "TEXT", "utilisateur_id": "INTEGER", "note": "REAL", "commentaire": "TEXT"},
+    }
+    NON_NULS = {
+        "utilisateurs": ("nom", "email", "mot_de_passe"),
+        "etageres": ("nom", "places_totales", "places_disponibles", "utilisateur_id"),
+        "bouteilles": ("nom",),
+        "notes": ("bouteille_nom", "bouteille_type", "bouteille_annee", "utilisateur_id"),
+    }
+    STATUTS = ('en stock', 'archivé')
+    DEFAUTS = {"bouteilles": {"quantite": 1, "statut": "en stock", "supprime": 0}}
+
+    def __init__(self):
+        self.tables = {table: {} for table in self.SCHEMA}
+        self.compteurs = {table: 0 for table in self.SCHEMA}
+        # index par utilisateur_id (jamais modifié après insertion)
+        self.par_utilisateur = {table: {} for table in self.SCHEMA}
+        self.verrou = threading.RLock()
+        self.journal = None
+
+    @contextmanager
+    def _transaction(self):
+        # chaque modification enregistre de quoi l'annuler, comme un ROLLBACK
+        with self.verrou:
+            self.journal = []
+            try:
+                yield
+            except Exception:
+                for annuler in reversed(self.journal):
+                    annuler()
+                raise
+            finally:
+                self.journal = None
+
+    def _verifier(self, table, ligne):
+        for col in self.NON_NULS[table]:
+            if ligne[col] is None:
+                raise Exception(f"NOT NULL constraint failed: {table}.{col}")
+        if table == "bouteilles" and ligne["statut"] is not None and ligne["statut"] not in self.STATUTS:
+            raise Exception("CHECK constraint failed: statut IN ('en stock','archivé')")
+
+    @staticmethod
+    def _affinite(type_colonne, valeur):
+        # même conversion que l'affinité de type de SQLite
+        if valeur is None:
+            return None
+        if type_colonne == "TEXT":
+            return str(valeur) if isinstance(valeur, (int, float)) else valeur
+        if isinstance(valeur, str):
+            try:
+                valeur = float(valeur) if type_colonne == "REAL" else int(valeur)
+            except ValueError:
+                try:
+                    valeur = float(valeur)
+                except ValueError:
+                    return valeur
+        if type_colonne == "REAL" and isinstance(valeur, int):
+            return float(valeur)
+        if type_colonne == "INTEGER" and isinstance(valeur, float) and valeur.is_integer():
+            return int(valeur)
+        return valeur
+
+    def _convertir(self, table, valeurs):
+        types = self.SCHEMA[table]
+        return {col: self._affinite(types[col], v) for col, v in valeurs.items()}
+
+    def _inserer(self, table, **valeurs):
+        ligne = {col: None for col in self.SCHEMA[table]}
+        ligne.update(self.DEFAUTS.get(table, {}))
+        ligne.update(self._convertir(table, valeurs))
+        self._verifier(table, ligne)
+        compteur = self.compteurs[table]
+        self.compteurs[table] += 1
+        ligne["id"] = self.compteurs[table]
+        self._ajouter_ligne(table, ligne)
+
+        def annuler():
+            self._retirer_ligne(table, ligne)
+            self.compteurs[table] = compteur
+        self.journal.append(annuler)
+        return ligne["id"]
+
+    def _modifier(self, table, ligne, **valeurs):
+        valeurs = self._convertir(table, valeurs)
+        self._verifier(table, {**ligne, **valeurs})
+        anciennes = {col: ligne[col] for col in valeurs}
+        ligne.update(valeurs)
+        self.journal.append(lambda: ligne.update(anciennes))
+
+    def _supprimer(self, table, ligne):
+        self._retirer_ligne(table, ligne)
+        self.journal.append(lambda: self._ajouter_ligne(table, ligne))
+
+    def _ajouter_ligne(self, table, ligne):
+        # une ligne restaurée reprend sa place dans l'ordre des id
+        if self.tables[table] and ligne["id"] < next(reversed(self.tables[table])):
+            self.tables[table] = dict(sorted({**self.tables[table], ligne["id"]: ligne}.items()))
+        else:
+            self.tables[table][ligne["id"]] = ligne
+        if "utilisateur_id" in ligne:
+            index = self.par_utilisateur[table].setdefault(ligne["utilisateur_id"], {})
+            if index and ligne["id"] < next(reversed(index)):
+                self.par_utilisateur[table][ligne["utilisateur_id"]] = dict(sorted({**index, ligne["id"]: ligne}.items()))
+            else:
+                index[ligne["id"]] = ligne
+
+    def _retirer_ligne(self, table, ligne):
+        del self.tables[table][ligne["id"]]
+        if "utilisateur_id" in ligne:
+            del self.par_utilisateur[table][ligne["utilisateur_id"]][ligne["id"]]
+
+    def _selectionner(self, table, **criteres):
+        # égalité SQL: une comparaison avec NULL n'est jamais vraie
+        criteres = self._convertir(table, criteres)
+        if any(v is None for v in criteres.values()):
+            return []
+        # les id sont croissants: l'ordre d'insertion des dictionnaires est l'ordre des id
+        if 'id' in criteres:
+            ligne = self.tables[table].get(criteres['id'])
+            lignes = [ligne] if ligne else []
+        elif 'utilisateur_id' in criteres:
+            lignes = self.par_utilisateur[table].get(criteres['utilisateur_id'], {}).values()
+        else:
+            lignes = self.tables[table].values()
+        return [ligne for ligne in lignes
+                if all(ligne[col] == v for col, v in criteres.items())]
+
+    def _premier(self, table, **criteres):
+        lignes = self._selectionner(table, **criteres)
+        return lignes[0] if lignes else None
+
+    # Utilisateurs
+    def creer_utilisateur(self, nom, email, mot_de_passe):
+        with self._transaction():
+            if self._premier("utilisateurs", email=email):
+                raise EmailDejaUtilise("Cet email est déjà utilisé.")
+            return self._inserer("utilisateurs", nom=nom, email=email, mot_de_passe=mot_de_passe)
+
+    def authentifier(self, email, mot_de_passe):
+        with self._transaction():
+            u = self._premier("utilisateurs", email=email, mot_de_passe=mot_de_passe)
+            return dict(u) if u else None
+
+    # Étagères
+    def lister_etageres(self, utilisateur_id):
+        with self._transaction():
+            etageres = []
+            for row in self._selectionner("etageres", utilisateur_id=utilisateur_id):
+                if row['nom'] == 'Consommées':
+                    continue
+
+                etag = dict(row)
+                br = self._selectionner("bouteilles", etagere_id=etag['id'], utilisateur_id=utilisateur_id, supprime=0)
+                etag['bouteilles'] = [dict(b) for b in br if b['statut'] == 'en stock']
+                etag['nb_bouteilles'] = len(etag['bouteilles'])
+                etageres.append(etag)
+
+            return etageres
+
+    def ajouter_etagere(self, nom, emplacement, places_totales, utilisateur_id):
+        with self._transaction():
+            return self._inserer("etageres", nom=nom, emplacement=emplacement, places_totales=places_totales,
+                                 places_disponibles=places_totales, utilisateur_id=utilisateur_id)
+
+    def obtenir_etagere(self, etagere_id, utilisateur_id):
+        with self._transaction():
+            e = self._premier("etageres", id=etagere_id, utilisateur_id=utilisateur_id)
+            return dict(e) if e else None
+
+    def modifier_etagere(self, etagere_id, nom, emplacement, places_totales, utilisateur_id):
+        with self._transaction():
+            for e in self._selectionner("etageres", id=etagere_id, utilisateur_id=utilisateur_id):
+                self._modifier("etageres", e, nom=nom, emplacement=emplacement, places_totales=places_totales)
+
+    def supprimer_etagere(self, etagere_id, utilisateur_id):
+        with self._transaction():
+            if self._selectionner("bouteilles", etagere_id=etagere_id, utilisateur_id=utilisateur_id):
+                raise Exception("Impossible de supprimer une étagère contenant des bouteilles.")
+
+            for e in self._selectionner("etageres", id=etagere_id, utilisateur_id=utilisateur_id):
+                self._supprimer("etageres", e)
+
+    # Bouteilles
+    def ajouter_bouteille(self, nom, annee, type_vin, domaine=None, quantite=1, note=None,
+                          commentaire=None, statut='en stock', etagere_id=None, utilisateur_id=None, etiquette=None):
+        with self._transaction():
+            if etagere_id:
+                places = self._premier("etageres", id=etagere_id, utilisateur_id=utilisateur_id)
+                if places is None or places['places_disponibles'] < quantite:
+                    raise Exception("Pas assez de place sur l'étagère ou étagère invalide.")
+                self._modifier("etageres", places, places_disponibles=places['places_disponibles'] - quantite)
+
+            return self._inserer("bouteilles", nom=nom, annee=annee, type=type_vin, domaine=domaine, quantite=quantite,
+                                 note=note, commentaire=commentaire, statut=statut, etagere_id=etagere_id,
+                                 utilisateur_id=utilisateur_id, etiquette=etiquette)
+
+    def obtenir_bouteille(self, bouteille_id, utilisateur_id):
+        with self._transaction():
+            b = self._premier("bouteilles", id=bouteille_id, utilisateur_id=utilisateur_id)
+            return dict(b) if b else None
+
+    def modifier_bouteille(self, bouteille_id, nom, annee, type_vin, domaine, quantite, note, commentaire, statut, etagere_id, utilisateur_id, etiquette=None):
+        with self._transaction():
+            for b in self._selectionner("bouteilles", id=bouteille_id, utilisateur_id=utilisateur_id):
+                self._modifier("bouteilles", b, nom=nom, annee=annee, type=type_vin, domaine=domaine, quantite=quantite,
+                               note=note, commentaire=commentaire, statut=statut, etagere_id=etagere_id, etiquette=etiquette)
+
+    def marquer_bouteille_supprimee(self, bouteille_id, utilisateur_id):
+        with self._transaction():
+            for b in self._selectionner("bouteilles", id=bouteille_id, utilisateur_id=utilisateur_id):
+                self._modifier("bouteilles", b, supprime=1)
+
+    def consommer_bouteille(self, bouteille_id, quantite_consomme, note=None, commentaire=None, utilisateur_id=None):
+        with self._transaction():
+            if utilisateur_id is None:
+                b = self._premier("bouteilles", id=bouteille_id)
+            else:
+                b = self._premier("bouteilles", id=bouteille_id, utilisateur_id=utilisateur_id)
+            if not b:
+                raise Exception("Bouteille introuvable")
+
+            # trouver ou créer étagère "Consommées"
+            consommee = self._premier("etageres", nom='Consommées', utilisateur_id=b['utilisateur_id'])
+            if not consommee:
+                etagere_id_cons = self._inserer("etageres", nom='Consommées', emplacement='', places_totales=1000,
+                                                places_disponibles=1000, utilisateur_id=b['utilisateur_id'])
+            else:
+                etagere_id_cons = consommee['id']
+
+            # la ligne d'origine est modifiée: garder ses valeurs initiales
+            b_initiale = dict(b)
+            nouvelle_quantite = b['quantite'] - quantite_consomme
+            if nouvelle_quantite <= 0:
+                self._modifier("bouteilles", b, statut='archivé', etagere_id=etagere_id_cons)
+            else:
+                self._modifier("bouteilles", b, quantite=nouvelle_quantite)
+                self._inserer("bouteilles", nom=b['nom'], annee=b['annee'], type=b['type'], domaine=b['domaine'],
+                              quantite=quantite_consomme, statut='archivé', etagere_id=etagere_id_cons,
+                              utilisateur_id=b['utilisateur_id'], etiquette=b['etiquette'])
+
+            # libérer la place
+            if b_initiale['etagere_id']:
+                for e in self._selectionner("etageres", id=b_initiale['etagere_id']):
+                    self._modifier("etageres", e, places_disponibles=e['places_disponibles'] + quantite_consomme)
+
+            # enregistrer note ou commentaire si fourni
+            if note is not None or (commentaire and commentaire.strip()):
+                self._inserer("notes", bouteille_nom=b['nom'], bouteille_type=b['type'], bouteille_annee=b['annee'],
+                              bouteille_domaine=b['domaine'], utilisateur_id=b['utilisateur_id'],
+                              note=note, commentaire=commentaire)
+
+    def obtenir_historique_degustation(self, utilisateur_id):
+        with self._transaction():
+            historique = []
+            bouteilles = self._selectionner("bouteilles", utilisateur_id=utilisateur_id, statut='archivé')
+            for b in reversed(bouteilles):
+                # domaines NULL considérés égaux entre eux, comme dans la requête SQL
+                notes = [n for n in self.par_utilisateur["notes"].get(b['utilisateur_id'], {}).values()
+                         if n['bouteille_nom'] == b['nom'] and n['bouteille_annee'] == b['annee']
+                         and n['bouteille_domaine'] == b['domaine'] and n['utilisateur_id'] == b['utilisateur_id']
+                         and b['annee'] is not None and b['nom'] is not None]
+                valeurs = [n['note'] for n in notes if n['note'] is not None]
+                historique.append({
+                    'id': b['id'],
+                    'nom': b['nom'],
+                    'annee': b['annee'],
+                    'domaine': b['domaine'],
+                    'type': b['type'],
+                    'quantite': b['quantite'],
+                    'note_degustation': notes[-1]['note'] if notes else None,
+                    'commentaire_degustation': notes[-1]['commentaire'] if notes else None,
+                    'moyenne_notes': sum(valeurs) / len(valeurs) if valeurs else None
+                })
+            return historique
+
+    # Ancienne fonction (non utilisée par la route /historique)
+    def obtenir_bouteilles_consommees(self, utilisateur_id):
+        with self._transaction():
+            rows = reversed(self._selectionner("bouteilles", utilisateur_id=utilisateur_id, statut='archivé'))
+            return [{
+                'bouteille_nom': r['nom'],
+                'bouteille_type': r['type'],
+                'bouteille_annee': r['annee'],
+                'bouteille_domaine': r['domaine'],
+                'quantite': r['quantite'],
+                'etiquette': r['etiquette'],
+                'commentaire': r['commentaire'],
+                'note': r['note']
+            } for r in rows]
+
+    # Notes
+    def ajouter_ou_modifier_note(self, bouteille_nom, bouteille_annee, bouteille_type, bouteille_domaine,
+                                 utilisateur_id, note, commentaire=None):
+        with self._transaction():
+            row = self._premier("notes", bouteille_nom=bouteille_nom, bouteille_annee=bouteille_annee,
+                                bouteille_type=bouteille_type, bouteille_domaine=bouteille_domaine,
+                                utilisateur_id=utilisateur_id)
+            if row:
+                self._modifier("notes", row, note=note, commentaire=commentaire)
+            else:
+                self._inserer("notes", bouteille_nom=bouteille_nom, bouteille_annee=bouteille_annee,
+                              bouteille_type=bouteille_type, bouteille_domaine=bouteille_domaine,
+                              utilisateur_id=utilisateur_id, note=note, commentaire=commentaire)
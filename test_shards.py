@@ -0,0 +1,164 @@
+# test_shards.py
+import threading
+
+import pytest
+
+from migrer_shards import migrer_vers_shards
+from stockage import DBShards, StockageSQLite
+
+
+def test_nom_shard(tmp_path):
+    par_utilisateur = DBShards(str(tmp_path / "a"))
+    par_groupe = DBShards(str(tmp_path / "b"), nb_shards=3)
+    assert par_utilisateur.nom_shard(7) == "utilisateur_7.db"
+    assert par_utilisateur.nom_shard("7") == "utilisateur_7.db"
+    assert par_groupe.nom_shard(7) == "shard_1.db"
+    par_utilisateur.fermer()
+    par_groupe.fermer()
+
+
+def test_eviction_lru(tmp_path):
+    shards = DBShards(str(tmp_path), max_connexions=2)
+    for uid in (1, 2, 3):
+        with shards.connexion(uid):
+            pass
+    assert list(shards.connexions) == [shards.chemin_shard(2), shards.chemin_shard(3)]
+
+    # un shard évincé est rouvert à la demande
+    with shards.connexion(1) as conn:
+        conn.execute("SELECT COUNT(*) FROM etageres").fetchone()
+    assert len(shards.connexions) == 2
+    shards.fermer()
+
+
+def test_ouverture_shards_silencieuse(tmp_path, capsys):
+    shards = DBShards(str(tmp_path), max_connexions=1)
+    capsys.readouterr()
+    for uid in (1, 2, 1, 2):
+        with shards.connexion(uid):
+            pass
+    assert capsys.readouterr().out == ""
+    shards.fermer()
+
+
+def test_eviction_epargne_connexion_en_cours(tmp_path):
+    shards = DBShards(str(tmp_path), max_connexions=1)
+    with shards.connexion(1) as conn:
+        with shards.connexion(2):
+            # les deux sont réservés: la limite est dépassée temporairement
+            assert len(shards.connexions) == 2
+        # le shard 1 est réservé: l'éviction a fermé le 2, pas lui
+        assert list(shards.connexions) == [shards.chemin_shard(1)]
+        assert conn.execute("SELECT COUNT(*) FROM etageres").fetchone()[0] == 0
+
+    with shards.connexion(3):
+        pass
+    assert list(shards.connexions) == [shards.chemin_shard(3)]
+    shards.fermer()
+
+
+def test_requete_pendant_utilisation_d_un_autre_shard(tmp_path):
+    stockage = StockageSQLite(mode="shards", dossier_shards=str(tmp_path), max_connexions=1)
+    u1 = stockage.creer_utilisateur("a", "a@cave.fr", "x")
+    u2 = stockage.creer_utilisateur("b", "b@cave.fr", "x")
+    stockage.ajouter_etagere("E1", "", 5, u1)
+    stockage.ajouter_etagere("E2", "", 5, u2)
+
+    with stockage.shards.connexion(u1) as conn:
+        assert [e['nom'] for e in stockage.lister_etageres(u2)] == ["E2"]
+        assert conn.execute("SELECT nom FROM etageres").fetchone()['nom'] == "E1"
+    stockage.fermer()
+
+
+def test_acces_concurrents(tmp_path):
+    stockage = StockageSQLite(mode="shards", dossier_shards=str(tmp_path), nb_shards=4, max_connexions=2)
+    utilisateurs = [stockage.creer_utilisateur(f"u{i}", f"u{i}@cave.fr", "x") for i in range(8)]
+    erreurs = []
+
+    def travailler(uid):
+        try:
+            etagere = stockage.ajouter_etagere("E", "", 100, uid)
+            for _ in range(20):
+                stockage.ajouter_bouteille("Vin", 2020, "rouge", quantite=1, etagere_id=etagere, utilisateur_id=uid)
+                stockage.lister_etageres(uid)
+        except Exception as e:
+            erreurs.append(e)
+
+    threads = [threading.Thread(target=travailler, args=(uid,)) for uid in utilisateurs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert erreurs == []
+    for uid in utilisateurs:
+        etagere, = stockage.lister_etageres(uid)
+        assert etagere['nb_bouteilles'] == 20
+        assert etagere['places_disponibles'] == 80
+    stockage.fermer()
+
+
+def test_repartition_enregistree(tmp_path):
+    dossier = str(tmp_path)
+    stockage = StockageSQLite(mode="shards", dossier_shards=dossier, nb_shards=4)
+    uid = stockage.creer_utilisateur("a", "a@cave.fr", "x")
+    stockage.ajouter_etagere("E", "", 5, uid)
+    stockage.fermer()
+
+    # une autre répartition ne trouverait plus les données: refusée
+    for nb_shards in (None, 3):
+        with pytest.raises(Exception, match="réparti en 4 shards"):
+            StockageSQLite(mode="shards", dossier_shards=dossier, nb_shards=nb_shards)
+    assert not (tmp_path / "utilisateur_1.db").exists()
+
+    stockage = StockageSQLite(mode="shards", dossier_shards=dossier, nb_shards=4)
+    assert [e['nom'] for e in stockage.lister_etageres(uid)] == ["E"]
+    stockage.fermer()
+
+    par_utilisateur = str(tmp_path / "u")
+    DBShards(par_utilisateur).fermer()
+    with pytest.raises(Exception, match="un fichier par utilisateur"):
+        DBShards(par_utilisateur, nb_shards=2)
+
+
+def test_schema_separe(tmp_path):
+    shards = DBShards(str(tmp_path))
+    with shards.connexion(1) as conn:
+        tables_shard = {r['name'] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    tables_annuaire = {r['name'] for r in shards.annuaire.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert {"etageres", "bouteilles", "notes"} <= tables_shard
+    assert "utilisateurs" not in tables_shard
+    assert "utilisateurs" in tables_annuaire
+    assert not tables_annuaire & {"etageres", "bouteilles", "notes"}
+    shards.fermer()
+
+
+def test_migration(tmp_path):
+    source = str(tmp_path / "cave.db")
+    dossier = str(tmp_path / "shards")
+    unique = StockageSQLite(db_name=source)
+    utilisateurs = []
+    for i in range(3):
+        uid = unique.creer_utilisateur(f"u{i}", f"u{i}@cave.fr", "x")
+        etagere = unique.ajouter_etagere("E", "", 5, uid)
+        bouteille = unique.ajouter_bouteille("Vin", 2020, "rouge", quantite=2, etagere_id=etagere, utilisateur_id=uid)
+        unique.consommer_bouteille(bouteille, 1, 7, "Bon", uid)
+        utilisateurs.append(uid)
+    attendu = {uid: (unique.lister_etageres(uid), [dict(r) for r in unique.obtenir_historique_degustation(uid)])
+               for uid in utilisateurs}
+    unique.fermer()
+
+    migrer_vers_shards(source, dossier, nb_shards=2)
+    shards = StockageSQLite(mode="shards", dossier_shards=dossier, nb_shards=2)
+    for uid in utilisateurs:
+        assert shards.authentifier(f"u{uid - 1}@cave.fr", "x")['id'] == uid
+        assert (shards.lister_etageres(uid), [dict(r) for r in shards.obtenir_historique_degustation(uid)]) == attendu[uid]
+    shards.fermer()
+
+    # la répartition choisie à la migration est enregistrée
+    with pytest.raises(Exception, match="réparti en 2 shards"):
+        StockageSQLite(mode="shards", dossier_shards=dossier)
+
+    # une seconde migration écraserait les données écrites depuis: refusée
+    with pytest.raises(Exception, match="dossier vide"):
+        migrer_vers_shards(source, dossier, nb_shards=2)
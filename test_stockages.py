@@ -0,0 +1,280 @@
+# test_stockages.py
+# Suite de conformité: chaque test tourne sur tous les backends de stockage.
+# PostgreSQL utilise CAVE_PG_DSN, ou à défaut un serveur jetable lancé par
+# pgserver; il est ignoré si ni l'un ni l'autre n'est disponible.
+import os
+import threading
+import uuid
+
+import pytest
+
+from CaveAvin import Cave_a_vin, EmailDejaUtilise, Stockage, StockageSQL, StockageSQLite, StockageMemoire, StockagePostgres
+from comparer_stockages import normaliser, scenario
+
+BACKENDS = ["sqlite", "sqlite_memoire", "shards_utilisateur", "shards_groupes", "memoire", "postgres"]
+
+
+@pytest.fixture(scope="session")
+def serveur_postgres(tmp_path_factory):
+    pytest.importorskip("psycopg2")
+    dsn = os.environ.get("CAVE_PG_DSN")
+    if dsn:
+        yield dsn
+        return
+    pgserver = pytest.importorskip("pgserver")
+    serveur = pgserver.get_server(tmp_path_factory.mktemp("postgres"), cleanup_mode="stop")
+    yield serveur.get_uri()
+    serveur.cleanup()
+
+
+@pytest.fixture
+def base_postgres(serveur_postgres):
+    # une base vide par test, supprimée ensuite
+    import psycopg2
+    from psycopg2.extensions import make_dsn
+
+    nom = f"cave_{uuid.uuid4().hex[:12]}"
+    admin = psycopg2.connect(serveur_postgres)
+    admin.autocommit = True
+    admin.cursor().execute(f"CREATE DATABASE {nom}")
+    yield make_dsn(serveur_postgres, dbname=nom)
+    admin.cursor().execute(f"DROP DATABASE {nom}")
+    admin.close()
+
+
+@pytest.fixture(params=BACKENDS)
+def stockage(request, tmp_path):
+    nom = request.param
+    if nom == "sqlite":
+        st = StockageSQLite(db_name=str(tmp_path / "cave.db"))
+    elif nom == "sqlite_memoire":
+        st = StockageSQLite(db_name=":memory:")
+    elif nom == "shards_utilisateur":
+        st = StockageSQLite(mode="shards", dossier_shards=str(tmp_path), max_connexions=2)
+    elif nom == "shards_groupes":
+        st = StockageSQLite(mode="shards", dossier_shards=str(tmp_path), nb_shards=3, max_connexions=2)
+    elif nom == "memoire":
+        st = StockageMemoire()
+    else:
+        st = StockagePostgres(request.getfixturevalue("base_postgres"), max_connexions=4)
+    yield st
+    st.fermer()
+
+
+@pytest.fixture
+def cave(stockage):
+    return Cave_a_vin(stockage)
+
+
+@pytest.fixture(scope="session")
+def reference():
+    cave = Cave_a_vin(StockageSQLite(db_name=":memory:"))
+    resultats = scenario(cave, 1)
+    cave.fermer()
+    return resultats
+
+
+def utilisateur(cave, nom="u"):
+    return cave.creer_utilisateur(nom, f"{nom}@cave.fr", "secret")
+
+
+def etat(cave, uid):
+    return normaliser([cave.lister_etageres(uid), cave.obtenir_historique_degustation(uid),
+                       cave.obtenir_bouteilles_consommees(uid)])
+
+
+# Conformité
+
+def test_backend_incomplet_refuse():
+    # une méthode manquante est signalée à la création, pas à la première requête
+    methodes = {nom: (lambda self, *args, **kwargs: None) for nom in Stockage.__abstractmethods__}
+    del methodes["ajouter_bouteille"]
+    Incomplet = type("Incomplet", (Stockage,), methodes)
+    with pytest.raises(TypeError, match="ajouter_bouteille"):
+        Incomplet()
+
+    class SansConnexion(StockageSQL):
+        pass
+    with pytest.raises(TypeError, match="_connexion"):
+        SansConnexion()
+
+
+def test_scenario_conforme(cave, reference):
+    # un seul utilisateur: les id sont les mêmes dans tous les backends
+    assert scenario(cave, 1) == reference
+
+
+def test_isolation_utilisateurs(cave):
+    utilisateurs = [utilisateur(cave, f"u{i}") for i in range(5)]
+    bouteilles = {}
+    for uid in utilisateurs:
+        etagere = cave.ajouter_etagere(f"E{uid}", "", 10, uid)
+        bouteilles[uid] = cave.ajouter_bouteille(f"Vin{uid}", 2020, "rouge", quantite=3, etagere_id=etagere, utilisateur_id=uid)
+        cave.consommer_bouteille(bouteilles[uid], 1, uid, f"Note {uid}", uid)
+
+    for uid in utilisateurs:
+        etagere, = cave.lister_etageres(uid)
+        assert etagere['nom'] == f"E{uid}"
+        assert [b['nom'] for b in etagere['bouteilles']] == [f"Vin{uid}"]
+        assert etagere['places_disponibles'] == 8
+        historique, = cave.obtenir_historique_degustation(uid)
+        assert (historique['nom'], historique['note_degustation']) == (f"Vin{uid}", uid)
+
+        # avec un fichier par utilisateur, un même id peut exister chez un autre
+        for autre in utilisateurs:
+            b = cave.obtenir_bouteille(bouteilles[autre], uid)
+            assert b is None or b['utilisateur_id'] == uid
+
+
+def test_ids_en_chaine(cave):
+    # les valeurs des formulaires et des URL arrivent sous forme de chaînes
+    uid = utilisateur(cave)
+    etagere = cave.ajouter_etagere("E", "", "6", uid)
+    bouteille = cave.ajouter_bouteille("Vin", "2019", "rouge", quantite=2, etagere_id=str(etagere), utilisateur_id=uid)
+
+    assert cave.obtenir_etagere(str(etagere), uid)['places_totales'] == 6
+    assert cave.obtenir_bouteille(str(bouteille), uid)['annee'] == 2019
+    assert [e['id'] for e in cave.lister_etageres(str(uid))] == [etagere]
+    cave.consommer_bouteille(str(bouteille), 1, None, None, uid)
+    assert cave.obtenir_etagere(etagere, uid)['places_disponibles'] == 5
+
+
+def test_etagere_inexistante_non_verifiee(cave):
+    # les clés étrangères ne sont vérifiées par aucun backend
+    uid = utilisateur(cave)
+    bouteille = cave.ajouter_bouteille("Vin", 2020, "rouge", utilisateur_id=uid)
+    cave.modifier_bouteille(bouteille, "Vin", 2020, "rouge", None, 1, None, None, "en stock", 9999, uid)
+    assert cave.obtenir_bouteille(bouteille, uid)['etagere_id'] == 9999
+
+
+def test_acces_concurrents(cave):
+    utilisateurs = [utilisateur(cave, f"u{i}") for i in range(6)]
+    etageres = {uid: cave.ajouter_etagere("E", "", 100, uid) for uid in utilisateurs}
+    erreurs = []
+
+    def travailler(uid):
+        try:
+            for _ in range(10):
+                cave.ajouter_bouteille("Vin", 2020, "rouge", quantite=1, etagere_id=etageres[uid], utilisateur_id=uid)
+                with pytest.raises(Exception, match="Pas assez de place"):
+                    cave.ajouter_bouteille("Vin", 2020, "rouge", quantite=1000, etagere_id=etageres[uid], utilisateur_id=uid)
+                cave.lister_etageres(uid)
+        except Exception as e:
+            erreurs.append(e)
+
+    # deux threads par utilisateur: même étagère modifiée en parallèle
+    threads = [threading.Thread(target=travailler, args=(uid,)) for uid in utilisateurs * 2]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert erreurs == []
+    for uid in utilisateurs:
+        etagere, = cave.lister_etageres(uid)
+        assert (etagere['nb_bouteilles'], etagere['places_disponibles']) == (20, 80)
+
+
+# Erreurs: l'opération échoue et ne laisse aucune trace
+
+def test_etagere_sans_nom(cave):
+    uid = utilisateur(cave)
+    with pytest.raises(Exception):
+        cave.ajouter_etagere(None, "", 5, uid)
+    assert cave.lister_etageres(uid) == []
+
+
+def test_etagere_sans_places(cave):
+    uid = utilisateur(cave)
+    with pytest.raises(Exception):
+        cave.ajouter_etagere("E", "", None, uid)
+    assert cave.lister_etageres(uid) == []
+
+
+def test_consommer_note_sans_type_annule_tout(cave):
+    uid = utilisateur(cave)
+    etagere = cave.ajouter_etagere("E", "", 5, uid)
+    bouteille = cave.ajouter_bouteille("Vin", 2020, None, quantite=2, etagere_id=etagere, utilisateur_id=uid)
+    avant = etat(cave, uid)
+
+    # notes.bouteille_type est NOT NULL: l'archivage déjà fait doit être annulé
+    with pytest.raises(Exception):
+        cave.consommer_bouteille(bouteille, 1, 7, "Bon", uid)
+    assert etat(cave, uid) == avant
+    assert cave.obtenir_bouteille(bouteille, uid)['quantite'] == 2
+
+
+def test_quantite_en_chaine_convertie(cave):
+    uid = utilisateur(cave)
+    etagere = cave.ajouter_etagere("E", "", 5, uid)
+    sur_etagere = cave.ajouter_bouteille("Vin", 2020, "rouge", quantite="2", etagere_id=etagere, utilisateur_id=uid)
+    sans_etagere = cave.ajouter_bouteille("Vin", 2020, "rouge", quantite=" 3 ", utilisateur_id=uid)
+    assert cave.obtenir_bouteille(sur_etagere, uid)['quantite'] == 2
+    assert cave.obtenir_bouteille(sans_etagere, uid)['quantite'] == 3
+    assert cave.obtenir_etagere(etagere, uid)['places_disponibles'] == 3
+
+
+@pytest.mark.parametrize("quantite", ["deux", "", None, 2.5, 0, "-1"])
+def test_quantite_invalide(cave, quantite):
+    uid = utilisateur(cave)
+    etagere = cave.ajouter_etagere("E", "", 5, uid)
+    avant = etat(cave, uid)
+    for etagere_id in (etagere, None):
+        with pytest.raises(ValueError, match="Quantité invalide"):
+            cave.ajouter_bouteille("Vin", 2020, "rouge", quantite=quantite, etagere_id=etagere_id, utilisateur_id=uid)
+    assert etat(cave, uid) == avant
+
+
+def test_pas_assez_de_place(cave):
+    uid = utilisateur(cave)
+    etagere = cave.ajouter_etagere("E", "", 2, uid)
+    avant = etat(cave, uid)
+    with pytest.raises(Exception, match="Pas assez de place"):
+        cave.ajouter_bouteille("Vin", 2020, "rouge", quantite=3, etagere_id=etagere, utilisateur_id=uid)
+    assert etat(cave, uid) == avant
+
+
+def test_etagere_d_un_autre_utilisateur(cave):
+    u1, u2 = utilisateur(cave, "a"), utilisateur(cave, "b")
+    etagere = cave.ajouter_etagere("E", "", 5, u1)
+    with pytest.raises(Exception, match="étagère invalide"):
+        cave.ajouter_bouteille("Vin", 2020, "rouge", etagere_id=etagere, utilisateur_id=u2)
+    assert cave.obtenir_etagere(etagere, u1)['places_disponibles'] == 5
+
+
+def test_statut_invalide(cave):
+    uid = utilisateur(cave)
+    etagere = cave.ajouter_etagere("E", "", 5, uid)
+    avant = etat(cave, uid)
+    with pytest.raises(Exception):
+        cave.ajouter_bouteille("Vin", 2020, "rouge", statut="bue", etagere_id=etagere, utilisateur_id=uid)
+    assert etat(cave, uid) == avant
+
+
+def test_supprimer_etagere_non_vide(cave):
+    uid = utilisateur(cave)
+    etagere = cave.ajouter_etagere("E", "", 5, uid)
+    cave.ajouter_bouteille("Vin", 2020, "rouge", etagere_id=etagere, utilisateur_id=uid)
+    with pytest.raises(Exception, match="contenant des bouteilles"):
+        cave.supprimer_etagere(etagere, uid)
+    assert cave.obtenir_etagere(etagere, uid) is not None
+
+
+def test_consommer_bouteille_introuvable(cave):
+    u1, u2 = utilisateur(cave, "a"), utilisateur(cave, "b")
+    bouteille = cave.ajouter_bouteille("Vin", 2020, "rouge", quantite=2, utilisateur_id=u1)
+    with pytest.raises(Exception, match="Bouteille introuvable"):
+        cave.consommer_bouteille(bouteille + 100, 1, None, None, u1)
+    # la bouteille d'un autre utilisateur n'est pas accessible
+    with pytest.raises(Exception, match="Bouteille introuvable"):
+        cave.consommer_bouteille(bouteille, 1, None, None, u2)
+    assert cave.obtenir_bouteille(bouteille, u1)['quantite'] == 2
+    assert cave.obtenir_historique_degustation(u2) == []
+
+
+def test_email_deja_utilise(cave):
+    uid = utilisateur(cave)
+    with pytest.raises(EmailDejaUtilise):
+        cave.creer_utilisateur("autre", "u@cave.fr", "autre")
+    assert cave.authentifier("u@cave.fr", "secret")['id'] == uid
+    assert cave.authentifier("u@cave.fr", "autre") is None